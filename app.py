@@ -1,24 +1,383 @@
 from flask import Flask,jsonify,request
-from functools import wraps
+from flask.json.provider import DefaultJSONProvider
+from functools import wraps,lru_cache
+from collections import defaultdict,OrderedDict
+import bisect
+import itertools
+import hashlib
+import hmac
+import threading
+import time
+import orjson
+import ormsgpack
 
 API_KEY = "podapati@1"
+KEY_CACHE_TTL = 60
+
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+
+def _is_valid_key(key):
+    """Check key against API_KEY, remembering accepted keys for KEY_CACHE_TTL seconds"""
+    key_hash = hashlib.blake2b(key.encode(),digest_size=16).digest()
+    now = time.monotonic()
+    with _key_cache_lock:
+        if _key_cache.get(key_hash,0) > now:
+            return True
+    if not hmac.compare_digest(key.encode(),API_KEY.encode()):
+        return False
+    with _key_cache_lock:
+        for cached_hash,expires in list(_key_cache.items()):
+            if expires <= now:
+                del _key_cache[cached_hash]
+        _key_cache[key_hash] = now + KEY_CACHE_TTL
+    return True
 
 def require_api_key(f):
     @wraps(f)
     def decorated(*args,**kwargs):
         key = request.headers.get("x-api-key")
-        if key and key == API_KEY:
+        if key and _is_valid_key(key):
             return f(*args, **kwargs)
         return jsonify({"error": "Unauthorized"}), 401
     return decorated
 
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Routes jsonify and request.get_json through orjson instead of the stdlib json module"""
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self,obj,**kwargs):
+        return orjson.dumps(obj,option=self.option).decode()
+
+    def loads(self,s,**kwargs):
+        return orjson.loads(s)
+
+    def response(self,*args,**kwargs):
+        obj = self._prepare_response_obj(args,kwargs)
+        return self._app.response_class(orjson.dumps(obj,option=self.option),mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+class Book:
+    __slots__ = ("id","_title","_author","_title_lc","_author_lc","_title_lc_b","_author_lc_b","_json_bytes")
+
+    def __init__(self,id,title,author):
+        self.id = id
+        self.title = title
+        self.author = author
+
+    @property
+    def title(self):
+        return self._title
+
+    @title.setter
+    def title(self,value):
+        self._title = value
+        self._title_lc = value.casefold()
+        self._title_lc_b = self._title_lc.encode()
+        self._json_bytes = None
+
+    @property
+    def author(self):
+        return self._author
+
+    @author.setter
+    def author(self,value):
+        self._author = value
+        self._author_lc = value.casefold()
+        self._author_lc_b = self._author_lc.encode()
+        self._json_bytes = None
+
+    @classmethod
+    def from_dict(cls,data):
+        """Build a Book from its to_dict() form without going through __init__"""
+        book = cls.__new__(cls)
+        book.id = data["id"]
+        book.title = data["title"]
+        book.author = data["author"]
+        return book
+
+    def to_dict(self):
+        return {"id": self.id, "title": self.title, "author": self.author}
+
+    def to_json(self):
+        """Serialized to_dict(), encoded once per change to the book"""
+        if self._json_bytes is None:
+            self._json_bytes = orjson.dumps(self.to_dict())
+        return self._json_bytes
+
+    def __repr__(self):
+        return f"Book({self.id}, '{self.title}', '{self.author}')"
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class BookStore:
+    """Keeps books in an insertion-ordered dict keyed by id, a sorted id list
+    for keyset pagination and trigram indexes over the lowercased title and
+    author for search. A page costs O(log n + limit); a delete is a dict pop
+    plus an O(n) memmove of the id list. Writers are serialised by a lock;
+    readers only ever see snapshots, so they can run alongside a write."""
+    def __init__(self,books=()):
+        self._books = {}
+        self._ids = []
+        self._lock = threading.Lock()
+        self.version = 0
+        self._title_grams = defaultdict(set)
+        self._author_grams = defaultdict(set)
+        for book in books:
+            self.add(book)
+
+    def _index(self,book):
+        for gram in _trigrams(book._title_lc):
+            self._title_grams[gram].add(book.id)
+        for gram in _trigrams(book._author_lc):
+            self._author_grams[gram].add(book.id)
+
+    def _unindex(self,book):
+        for grams,text in ((self._title_grams,book._title_lc),(self._author_grams,book._author_lc)):
+            for gram in _trigrams(text):
+                ids = grams[gram]
+                ids.discard(book.id)
+                if not ids:
+                    del grams[gram]
+
+    def __len__(self):
+        return len(self._books)
+
+    def all(self):
+        """A snapshot of the books in insertion order, safe to walk while the store changes"""
+        return tuple(self._books.values())
+
+    def get(self,book_id):
+        return self._books.get(book_id)
+
+    def add(self,book):
+        with self._lock:
+            self._books[book.id] = book
+            bisect.insort(self._ids,book.id)
+            self._index(book)
+            self.version += 1
+
+    def update(self,book,title,author):
+        with self._lock:
+            self._unindex(book)
+            book.title = title
+            book.author = author
+            self._index(book)
+            self.version += 1
+
+    def remove(self,book_id):
+        with self._lock:
+            book = self._books.get(book_id)
+            if book is not None:
+                # Unindex first so a concurrent search never sees an id that is already gone
+                self._unindex(book)
+                del self._books[book_id]
+                del self._ids[bisect.bisect_left(self._ids,book_id)]
+                self.version += 1
+            return book
+
+    def page_after(self,after_id,limit):
+        """Up to limit books with ids greater than after_id, and whether more follow"""
+        ids = self._ids
+        start = bisect.bisect_right(ids,after_id)
+        # One extra id tells us whether another page follows; ids removed
+        # since the slice was taken are skipped
+        page = [book for book in map(self._books.get,ids[start:start + limit + 1]) if book is not None]
+        return page[:limit],len(page) > limit
+
+    def candidates(self,author_lc=None,title_lc=None):
+        """Books that may contain both needles; needles shorter than a trigram
+        can't be narrowed down, so the caller still has to verify matches"""
+        candidate_ids = None
+        for grams,needle in ((self._author_grams,author_lc),(self._title_grams,title_lc)):
+            if not needle or len(needle) < 3:
+                continue
+            for gram in _trigrams(needle):
+                ids = grams.get(gram)
+                if not ids:
+                    return []
+                candidate_ids = set(ids) if candidate_ids is None else candidate_ids & ids
+        if candidate_ids is None:
+            return self.all()
+        books = (self._books.get(book_id) for book_id in sorted(candidate_ids))
+        return [book for book in books if book is not None]
+
+
+def validate_book_payload(data,partial=False):
+    """Return the title/author fields of a request body, raising ValueError if it is malformed.
+    With partial=True either field may be left out, as for an update."""
+    if not isinstance(data,dict):
+        raise ValueError("Request body must be a JSON object")
+    fields = {}
+    for field in ("title","author"):
+        if field not in data:
+            if partial:
+                continue
+            raise ValueError("Both 'title' and 'author' are required")
+        if not isinstance(data[field],str):
+            raise ValueError(f"'{field}' must be a string")
+        fields[field] = data[field]
+    return fields
 
-books = [
+
+store = BookStore(map(Book.from_dict,[
         {"id": 1, "title": "Clean Code", "author": "Robert C. Martin"},
         {"id": 2, "title": "Deep Learning", "author": "Ian Goodfellow"},
-    ]
+    ]))
+
+# next() on itertools.count is atomic under the GIL, so ids never repeat even after deletes
+_next_id = itertools.count(max((book.id for book in store.all()),default=0) + 1)
+
+RESPONSE_CACHE_BYTES = 8 * 1024 * 1024
+
+
+class RenderCache:
+    """LRU cache of rendered response bodies bounded by their total size, so
+    read-only traffic with many distinct queries can't grow it with the
+    catalog. A body larger than max_entry_bytes is never stored."""
+    def __init__(self,max_bytes,max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self,key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self,key,body):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(key,None)
+            if old is not None:
+                self._size -= len(old)
+            self._bodies[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _,evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._bodies)
+
+    @property
+    def size(self):
+        return self._size
+
+
+_rendered = RenderCache(RESPONSE_CACHE_BYTES,RESPONSE_CACHE_BYTES // 4)
+
+@lru_cache(maxsize=4)
+def _compile_filter(has_author,has_title):
+    """Generate a filter specialised to the active needles, so the loop body
+    only does the substring checks that were asked for. Matching is on the
+    UTF-8 bytes, which takes CPython's bytes search fast path."""
+    checks = []
+    if has_author:
+        checks.append("author_b in book._author_lc_b")
+    if has_title:
+        checks.append("title_b in book._title_lc_b")
+    source = (
+        "def book_filter(books,author_b,title_b):\n"
+        f"    return [book for book in books if {' and '.join(checks) or 'True'}]\n"
+    )
+    namespace = {}
+    exec(source,namespace)
+    return namespace["book_filter"]
+
+def _select_books(after_id,limit):
+    """The books for a /books request and the cursor for the next page, if any"""
+    if limit is None:
+        return store.all(),None
+    page,has_more = store.page_after(after_id,limit)
+    return page,(page[-1].id if has_more else None)
+
+def _search_books(author_lc,title_lc):
+    results = store.candidates(author_lc,title_lc)
+
+    if author_lc or title_lc:
+        book_filter = _compile_filter(bool(author_lc),bool(title_lc))
+        results = book_filter(results,
+                              author_lc.encode() if author_lc else None,
+                              title_lc.encode() if title_lc else None)
+
+    return results
+
+# Keyed on the store version so a render racing a mutation can't be served stale;
+# mutating routes also call _clear_rendered() so old versions don't hold memory
+def _render_books(version,after_id,limit):
+    key = ("books",version,after_id,limit)
+    body = _rendered.get(key)
+    if body is None:
+        books,next_after_id = _select_books(after_id,limit)
+        if limit is None:
+            body = _json_array(books)
+        else:
+            body = b'{"books":%s,"next_after_id":%s}' % (_json_array(books),orjson.dumps(next_after_id))
+        _rendered.put(key,body)
+    return body
+
+def _render_search(version,author_lc,title_lc):
+    key = ("search",version,author_lc,title_lc)
+    body = _rendered.get(key)
+    if body is None:
+        body = _json_array(_search_books(author_lc,title_lc))
+        _rendered.put(key,body)
+    return body
+
+def _clear_rendered():
+    _rendered.clear()
+
+def _json_array(books):
+    return b"[" + b",".join(map(Book.to_json,books)) + b"]"
+
+# JSON and MessagePack bodies are negotiated on Accept, so shared caches must key on it
+def _json_body(body):
+    response = app.response_class(body,mimetype="application/json")
+    response.vary.add("Accept")
+    return response
+
+def _ndjson_body(books):
+    """Stream one JSON object per line; the list is copied so later mutations don't affect the stream"""
+    books = tuple(books)
+    def generate():
+        for book in books:
+            yield book.to_json() + b"\n"
+    return app.response_class(generate(),mimetype="application/x-ndjson")
+
+def _wants_ndjson():
+    return request.args.get("format") == "ndjson"
+
+def _wants_msgpack():
+    return request.accept_mimetypes.best_match(("application/json","application/msgpack")) == "application/msgpack"
+
+def _msgpack_body(payload):
+    response = app.response_class(ormsgpack.packb(payload),mimetype="application/msgpack")
+    response.vary.add("Accept")
+    return response
+
+def _book_body(book):
+    if _wants_msgpack():
+        return _msgpack_body(book.to_dict())
+    return _json_body(book.to_json())
+
 
 @app.route("/")
 def home():
@@ -27,13 +386,45 @@ def home():
 
 @app.route("/books")
 def get_books():
-    return jsonify(books)
+    after_id = request.args.get("after_id",type=int)
+    limit = request.args.get("limit",type=int)
+
+    if "after_id" not in request.args and "limit" not in request.args:
+        after_id = None
+    elif limit is None or limit < 1:
+        return jsonify({"error": "'limit' must be a positive integer"}), 400
+    elif "after_id" in request.args and (after_id is None or after_id < 0):
+        return jsonify({"error": "'after_id' must be a non-negative integer"}), 400
+    else:
+        after_id = after_id or 0
+
+    version = store.version
+    msgpack = _wants_msgpack()
+    etag = hashlib.blake2b(f"{version}:{msgpack}:{request.query_string.decode()}".encode(),digest_size=8).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif _wants_ndjson():
+        books,next_after_id = _select_books(after_id,limit)
+        response = _ndjson_body(books)
+        if next_after_id is not None:
+            response.headers["X-Next-After-Id"] = str(next_after_id)
+    elif msgpack:
+        books,next_after_id = _select_books(after_id,limit)
+        payload = [book.to_dict() for book in books]
+        if limit is not None:
+            payload = {"books": payload, "next_after_id": next_after_id}
+        response = _msgpack_body(payload)
+    else:
+        response = _json_body(_render_books(version,after_id,limit))
+    response.set_etag(etag)
+    response.vary.add("Accept")
+    return response
 
 @app.route("/books/<int:book_id>")
 def get_book(book_id):
-    for book in books:
-        if book["id"] == book_id:
-            return jsonify(book)
+    book = store.get(book_id)
+    if book:
+        return _book_body(book)
     return jsonify({"error" : "Book not found"}),404
 
 @app.route("/search")
@@ -41,53 +432,53 @@ def search_books():
     author = request.args.get("author")
     title = request.args.get("title")
 
-    results = books
-
-    if author:
-        results = [book for book in results if author.lower() in book["author"].lower()]
-    if title:
-        results = [book for book in results if title.lower() in book["title"].lower()]
+    author_lc = author.casefold() if author else None
+    title_lc = title.casefold() if title else None
 
-    return jsonify(results)
+    if _wants_ndjson():
+        return _ndjson_body(_search_books(author_lc,title_lc))
+    if _wants_msgpack():
+        return _msgpack_body([book.to_dict() for book in _search_books(author_lc,title_lc)])
+    return _json_body(_render_search(store.version,author_lc,title_lc))
 
 
 @app.route("/add_book",methods=["POST"])
 @require_api_key
 def add_book():
-    data = request.get_json()
-
-    if not data or "title" not in data or "author" not in data:
-        return jsonify({"error": "Both 'title' and 'author' are required"}), 400
-    new_book ={
-        "id":len(books) + 1,
-        "title" : data["title"],
-        "author" : data["author"]
-
-    }
-    books.append(new_book)
-    return jsonify(new_book),201
+    try:
+        fields = validate_book_payload(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    new_book = Book(next(_next_id),fields["title"],fields["author"])
+    store.add(new_book)
+    _clear_rendered()
+    return _book_body(new_book),201
 
 @app.route("/books/<int:book_id>",methods=["PUT"])
 @require_api_key
 def update_book(book_id):
-    data = request.get_json()
-    for book in books:
-        if book["id"] == book_id:
-            book["title"] = data.get("title",book["title"])
-            book["author"] = data.get("author",book["author"])
-            return jsonify(book)
+    book = store.get(book_id)
+    if book:
+        try:
+            fields = validate_book_payload(request.get_json(),partial=True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        store.update(book,fields.get("title",book.title),fields.get("author",book.author))
+        _clear_rendered()
+        return _book_body(book)
     return jsonify({"error":"Book not Found"}),404
 
 @app.route("/books/<int:book_id>",methods=["DELETE"])
 @require_api_key
 def remove_book(book_id):
-    for book in books:
-        if book["id"] == book_id:
-            books.remove(book)
-            return jsonify({
+    if store.remove(book_id):
+        _clear_rendered()
+        if _wants_msgpack():
+            return _msgpack_body({
                     "message": "Book deleted successfully",
-                    "books" : books
+                    "books" : [book.to_dict() for book in store.all()]
                        })
+        return _json_body(b'{"message":"Book deleted successfully","books":%s}' % _json_array(store.all()))
     return jsonify({"Error":"book not found"}),404
 
 @app.errorhandler(404)
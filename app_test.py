@@ -0,0 +1,229 @@
+import itertools
+import sys
+import threading
+import unittest
+
+import app as app_module
+from app import Book, BookStore, RenderCache
+
+API_HEADERS = {"x-api-key": app_module.API_KEY}
+
+
+def make_store(count):
+    return BookStore(Book(i, f"Title {i}", f"Author {i}") for i in range(1, count + 1))
+
+
+class BookStoreTest(unittest.TestCase):
+
+    def test_all_is_a_snapshot(self):
+        store = make_store(3)
+        books = store.all()
+        store.add(Book(4, "Later", "Someone"))
+        store.remove(1)
+        self.assertEqual([book.id for book in books], [1, 2, 3])
+        self.assertEqual([book.id for book in store.all()], [2, 3, 4])
+
+    def test_page_after_walks_every_book_once(self):
+        store = make_store(10)
+        for book_id in (1, 2, 5, 9):
+            store.remove(book_id)
+
+        seen = []
+        after_id = 0
+        while True:
+            page, has_more = store.page_after(after_id, 3)
+            seen.extend(book.id for book in page)
+            if not has_more:
+                break
+            after_id = page[-1].id
+        self.assertEqual(seen, [3, 4, 6, 7, 8, 10])
+
+    def test_remove_drops_the_id_from_the_page_index(self):
+        store = make_store(100)
+        for book_id in range(1, 91):
+            store.remove(book_id)
+        self.assertEqual(store._ids, list(range(91, 101)))
+        page, has_more = store.page_after(0, 5)
+        self.assertEqual([book.id for book in page], [91, 92, 93, 94, 95])
+        self.assertTrue(has_more)
+
+    def test_readers_survive_concurrent_writes(self):
+        store = make_store(200)
+        errors = []
+        done = threading.Event()
+
+        def writer():
+            next_id = 201
+            while not done.is_set():
+                store.add(Book(next_id, "Churn", "Writer"))
+                store.remove(next_id - 150)
+                next_id += 1
+
+        def reader():
+            try:
+                for _ in range(300):
+                    app_module._json_array(store.all())
+                    store.page_after(0, 50)
+                    list(store.candidates(None, "ch"))
+                    list(store.candidates(None, "churn"))
+            except Exception as e:
+                errors.append(e)
+
+        # Switch threads often so the reader is interrupted mid-iteration
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        try:
+            reader()
+        finally:
+            done.set()
+            writer_thread.join()
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used_to_stay_under_budget(self):
+        cache = RenderCache(max_bytes=10, max_entry_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1234")
+        self.assertEqual(cache.size, 8)
+
+    def test_skips_bodies_over_the_entry_limit(self):
+        cache = RenderCache(max_bytes=100, max_entry_bytes=10)
+        cache.put("big", b"x" * 11)
+        self.assertIsNone(cache.get("big"))
+        self.assertEqual(cache.size, 0)
+
+
+class ApiTest(unittest.TestCase):
+
+    def setUp(self):
+        app_module.store = make_store(5)
+        app_module._next_id = itertools.count(6)
+        app_module._rendered.clear()
+        self.client = app_module.app.test_client()
+
+
+class SearchDuringDeleteTest(ApiTest):
+
+    def test_trigram_path_skips_ids_missing_from_the_store(self):
+        store = app_module.store
+        # The state a concurrent search could observe mid-delete: book 1 is
+        # gone from the dict but its trigrams are still indexed
+        del store._books[1]
+        self.assertEqual([book.id for book in store.candidates(None, "title 1")], [])
+        self.assertEqual(len(store.candidates(None, "title")), 4)
+
+    def test_short_needle_path_walks_a_snapshot(self):
+        results = app_module.store.candidates(None, "ti")
+        app_module.store.remove(1)
+        app_module.store.add(Book(6, "Title 6", "Author 6"))
+        self.assertEqual([book.id for book in app_module._search_books(None, "ti")], [2, 3, 4, 5, 6])
+        self.assertEqual([book.id for book in results], [1, 2, 3, 4, 5])
+
+    def test_both_paths_survive_concurrent_deletes(self):
+        store = make_store(300)
+        app_module.store = store
+        errors = []
+        done = threading.Event()
+
+        def writer():
+            next_id = 301
+            while not done.is_set():
+                store.add(Book(next_id, f"Title {next_id}", "Writer"))
+                store.remove(next_id - 250)
+                next_id += 1
+
+        def reader():
+            try:
+                for _ in range(200):
+                    app_module._search_books(None, "ti")
+                    app_module._search_books(None, "title")
+                    app_module._search_books("writer", "title")
+            except Exception as e:
+                errors.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        try:
+            reader()
+        finally:
+            done.set()
+            writer_thread.join()
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+    def test_search_routes_reflect_a_delete(self):
+        self.client.delete("/books/1", headers=API_HEADERS)
+        for query in ("title=ti", "title=title", "author=author&title=title"):
+            ids = [book["id"] for book in self.client.get(f"/search?{query}").get_json()]
+            self.assertEqual(ids, [2, 3, 4, 5], query)
+
+
+class ResponseCacheTest(ApiTest):
+
+    def test_reads_are_cached_until_a_mutation(self):
+        self.client.get("/books")
+        self.client.get("/search?title=title")
+        self.assertEqual(len(app_module._rendered), 2)
+
+        self.client.delete("/books/1", headers=API_HEADERS)
+        self.assertEqual(len(app_module._rendered), 0)
+        self.assertEqual([book["id"] for book in self.client.get("/books").get_json()], [2, 3, 4, 5])
+
+    def test_distinct_queries_stay_within_the_byte_budget(self):
+        self.addCleanup(setattr, app_module, "_rendered", app_module._rendered)
+        app_module._rendered = RenderCache(max_bytes=2048, max_entry_bytes=1024)
+        for after_id in range(50):
+            self.client.get(f"/books?limit=1000&after_id={after_id}")
+        self.assertLessEqual(app_module._rendered.size, 2048)
+
+
+class PaginationTest(ApiTest):
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get("/books?limit=2").get_json()
+        self.assertEqual([book["id"] for book in first["books"]], [1, 2])
+        self.assertEqual(first["next_after_id"], 2)
+
+        last = self.client.get("/books?limit=2&after_id=4").get_json()
+        self.assertEqual([book["id"] for book in last["books"]], [5])
+        self.assertIsNone(last["next_after_id"])
+
+    def test_without_parameters_returns_the_bare_list(self):
+        self.assertEqual(len(self.client.get("/books").get_json()), 5)
+
+    def test_rejects_malformed_parameters(self):
+        for query in ("limit=0", "limit=x", "after_id=2", "limit=1&after_id=abc", "limit=1&after_id=-1"):
+            self.assertEqual(self.client.get(f"/books?{query}").status_code, 400, query)
+
+
+class ETagTest(ApiTest):
+
+    def test_matching_if_none_match_returns_304(self):
+        etag = self.client.get("/books").headers["ETag"]
+        response = self.client.get("/books", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+
+    def test_etag_changes_with_query_and_catalog(self):
+        etag = self.client.get("/books").headers["ETag"]
+        self.assertNotEqual(self.client.get("/books?limit=1").headers["ETag"], etag)
+
+        self.client.delete("/books/1", headers=API_HEADERS)
+        response = self.client.get("/books", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()